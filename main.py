@@ -1,12 +1,23 @@
 from __future__ import annotations
+import io
 import time
+from typing import TYPE_CHECKING
 
 import streamlit as st
-from src.usdai_agent.usda_client import USDAClient
-from usdai_agent.param_agent import ParamAgent
-from src.usdai_agent.answer_agent import AnswerAgent
+from src.usdai_agent._states import to_alpha
 
+# pandas, openai, httpx, polars and the agents are imported where they are first needed,
+# so the landing page renders without paying for them on a cold start.
+if TYPE_CHECKING:
+    import pandas as pd
+    from openai import OpenAI
+    from src.usdai_agent.usda_client import USDAClient
+
+# Columns kept from USDA responses for the preview and the Answer Agent. Besides the
+# descriptors, this keeps what tells otherwise identical rows apart: source (SURVEY vs
+# CENSUS), domain category, location and week.
 PREFERRED = [
+    "source_desc",
     "commodity_desc",
     "class_desc",
     "prodn_practice_desc",
@@ -16,15 +27,20 @@ PREFERRED = [
     "sector_desc",
     "group_desc",
     "agg_level_desc",
+    "location_desc",
     "state_alpha",
     "state_name",
     "county_name",
+    "county_ansi",
     "year",
     "freq_desc",
     "reference_period_desc",
+    "week_ending",
     "short_desc",
     "domain_desc",
-    "value",
+    "domaincat_desc",
+    "Value",
+    "CV (%)",
 ]
 
 # Example questions for sidebar
@@ -35,59 +51,95 @@ EXAMPLE_QUESTIONS = [
     "What was the Oats yield in Minnesota for 2019?",
 ]
 
-STATE_NAME_TO_ALPHA = {
-    "ALABAMA": "AL",
-    "ALASKA": "AK",
-    "ARIZONA": "AZ",
-    "ARKANSAS": "AR",
-    "CALIFORNIA": "CA",
-    "COLORADO": "CO",
-    "CONNECTICUT": "CT",
-    "DELAWARE": "DE",
-    "DISTRICT OF COLUMBIA": "DC",
-    "FLORIDA": "FL",
-    "GEORGIA": "GA",
-    "HAWAII": "HI",
-    "IDAHO": "ID",
-    "ILLINOIS": "IL",
-    "INDIANA": "IN",
-    "IOWA": "IA",
-    "KANSAS": "KS",
-    "KENTUCKY": "KY",
-    "LOUISIANA": "LA",
-    "MAINE": "ME",
-    "MARYLAND": "MD",
-    "MASSACHUSETTS": "MA",
-    "MICHIGAN": "MI",
-    "MINNESOTA": "MN",
-    "MISSISSIPPI": "MS",
-    "MISSOURI": "MO",
-    "MONTANA": "MT",
-    "NEBRASKA": "NE",
-    "NEVADA": "NV",
-    "NEW HAMPSHIRE": "NH",
-    "NEW JERSEY": "NJ",
-    "NEW MEXICO": "NM",
-    "NEW YORK": "NY",
-    "NORTH CAROLINA": "NC",
-    "NORTH DAKOTA": "ND",
-    "OHIO": "OH",
-    "OKLAHOMA": "OK",
-    "OREGON": "OR",
-    "PENNSYLVANIA": "PA",
-    "RHODE ISLAND": "RI",
-    "SOUTH CAROLINA": "SC",
-    "SOUTH DAKOTA": "SD",
-    "TENNESSEE": "TN",
-    "TEXAS": "TX",
-    "UTAH": "UT",
-    "VERMONT": "VT",
-    "VIRGINIA": "VA",
-    "WASHINGTON": "WA",
-    "WEST VIRGINIA": "WV",
-    "WISCONSIN": "WI",
-    "WYOMING": "WY",
-}
+
+@st.cache_resource(show_spinner=False)
+def get_usda_client(api_key: str, timeout: float) -> USDAClient:
+    """One USDAClient (and connection pool) per key/timeout, shared across reruns."""
+    from src.usdai_agent.usda_client import USDAClient
+
+    return USDAClient(api_key, timeout=timeout)
+
+
+@st.cache_resource(show_spinner=False)
+def get_openai_client(api_key: str) -> OpenAI:
+    """One OpenAI client shared by both agents and across reruns, so its TLS
+    connection is set up once and kept alive between submits."""
+    import httpx
+    from openai import DefaultHttpxClient, OpenAI
+
+    return OpenAI(
+        api_key=api_key,
+        http_client=DefaultHttpxClient(
+            limits=httpx.Limits(max_keepalive_connections=8, keepalive_expiry=300.0)
+        ),
+    )
+
+
+class _UncachedFetch(Exception):
+    """Carries a failed fetch result out of `_fetch_usda_cached` without caching it."""
+
+    def __init__(self, result: tuple):
+        super().__init__("USDA fetch failed")
+        self.result = result
+
+
+# An hour in-process on top of USDAClient's 24 h disk TTL, so data is at most ~25 h old.
+@st.cache_data(ttl=3600, show_spinner=False, max_entries=64)
+def _fetch_usda_cached(
+    api_key: str, timeout: float, frozen_params: tuple, columns: tuple | None
+) -> tuple:
+    params = {k: list(v) if isinstance(v, tuple) else v for k, v in frozen_params}
+    df, meta = get_usda_client(api_key, timeout).fetch(
+        params, columns=list(columns) if columns is not None else None
+    )
+    if meta.get("error"):
+        # Streamlit never caches a raised exception, so failures are retried next time.
+        raise _UncachedFetch((df, meta))
+    return df, {**meta, "fetched_at": time.time()}
+
+
+def fetch_usda(
+    api_key: str, timeout: float, params: dict, columns: list | None = None
+) -> tuple:
+    """Fetch USDA data, memoized in-process on top of USDAClient's disk cache."""
+    frozen = tuple(
+        sorted((k, tuple(v) if isinstance(v, list) else v) for k, v in params.items())
+    )
+    started = time.time()
+    try:
+        df, meta = _fetch_usda_cached(
+            api_key, timeout, frozen, tuple(columns) if columns is not None else None
+        )
+    except _UncachedFetch as e:
+        return e.result
+    # An entry stored before this call is an in-process hit, whatever the first fetch saw.
+    if meta.get("fetched_at", started) < started:
+        meta = {**meta, "from_cache": True}
+    return df, meta
+
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def encode_dataset(fingerprint: str, _df: pd.DataFrame) -> dict:
+    """Encode the full dataset for download as CSV and Parquet, using Polars' writers.
+
+    Cached on `fingerprint` alone: the leading underscore tells Streamlit not to hash
+    `_df`, which would otherwise cost a full pass over the frame on every rerun.
+    """
+    import polars as pl
+    import pyarrow as pa
+
+    try:
+        table = pa.Table.from_pandas(_df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # A mixed-type object column; nullable strings keep NA while letting Arrow in.
+        table = pa.Table.from_pandas(_df.astype("string"), preserve_index=False)
+    pl_df = pl.from_arrow(table)
+    parquet_buf = io.BytesIO()
+    pl_df.write_parquet(parquet_buf, compression="zstd")
+    return {
+        "csv": pl_df.write_csv().encode("utf-8"),
+        "parquet": parquet_buf.getvalue(),
+    }
 
 
 def sanitize_params(d: dict) -> dict:
@@ -95,9 +147,9 @@ def sanitize_params(d: dict) -> dict:
         return {}
     out = {k: v for k, v in d.items() if v not in (None, "", [], {})}
     if "state_name" in out:
-        s = str(out.pop("state_name")).upper()
-        if s in STATE_NAME_TO_ALPHA:
-            out["state_alpha"] = STATE_NAME_TO_ALPHA[s]
+        alpha = to_alpha(str(out.pop("state_name")))
+        if alpha:
+            out["state_alpha"] = alpha
     if "commodity_desc" in out:
         out["commodity_desc"] = str(out["commodity_desc"]).upper()
     if "statisticcat_desc" in out:
@@ -175,6 +227,8 @@ if "cleared" in locals() and cleared:
     st.session_state.pop("last_df", None)
     st.session_state.pop("last_explanation", None)
     st.session_state.pop("last_latency_ms", None)
+    st.session_state.pop("last_full_df", None)
+    st.session_state.pop("last_full_fp", None)
     st.rerun()
 
 if submitted:
@@ -189,7 +243,10 @@ if submitted:
             "No OpenAI API key provided. Please add `OPENAI_API_KEY` to `.streamlit/secrets.toml` or enter it in the sidebar."
         )
         st.stop()
-    if not ParamAgent:
+    try:
+        from usdai_agent.param_agent import ParamAgent
+        from src.usdai_agent.answer_agent import AnswerAgent, template_answer
+    except ImportError:
         st.error(
             "Parameter Agent class not available. Ensure `src/usdai_agent/param_agent.py` exists."
         )
@@ -206,7 +263,13 @@ if submitted:
     progress = st.progress(0)
     try:
         t_param_start = time.perf_counter()
-        agent = ParamAgent(api_key=openai_key, model=model, temperature=temperature)
+        openai_client = get_openai_client(openai_key)
+        agent = ParamAgent(
+            api_key=openai_key,
+            model=model,
+            temperature=temperature,
+            client=openai_client,
+        )
         gen_raw = agent.generate(question)
         params = sanitize_params(gen_raw)
         t_param_end = time.perf_counter()
@@ -230,14 +293,22 @@ if submitted:
         status_box.update(
             label="Step 2/3: Retrieving data from USDA Quick Stats…", state="running"
         )
-        client = USDAClient(usda_key, timeout=float(req_timeout))
         t_fetch_start = time.perf_counter()
-        df = client.fetch(params)
+        # Only PREFERRED columns; the full set is fetched if a download is requested.
+        df, fetch_meta = fetch_usda(
+            usda_key, float(req_timeout), params, columns=PREFERRED
+        )
+        if fetch_meta.get("error"):
+            # fetch() reports failures instead of raising; don't show them as 0 rows.
+            status_box.update(label="USDA API error", state="error")
+            st.error(fetch_meta["error"])
+            st.stop()
         t_fetch_end = time.perf_counter()
         dt_fetch_ms = int((t_fetch_end - t_fetch_start) * 1000)
+        cached_note = " (served from cache)" if fetch_meta.get("from_cache") else ""
         status_box.update(label="Step 2/3: Data fetched", state="running")
         status_box.write(
-            f"**Step 2** · USDA query completed in **{dt_fetch_ms} ms**. Rows returned: {getattr(df, 'shape', [0])[0]:,}."
+            f"**Step 2** · USDA query completed in **{dt_fetch_ms} ms**{cached_note}. Rows returned: {getattr(df, 'shape', [0])[0]:,}."
         )
         progress.progress(66)
     except Exception as e:
@@ -251,18 +322,33 @@ if submitted:
             label="Step 3/3: Analyzing results with Answer Agent…", state="running"
         )
         t_answer_start = time.perf_counter()
-        expl_agent = AnswerAgent(
-            api_key=openai_key, model=model, temperature=temperature
-        )
-        explanation_md = expl_agent.generate(
-            st.session_state.get("question", ""), params, df
-        )
+        # Single-figure lookups get a deterministic answer; the LLM handles the rest.
+        explanation_md = template_answer(params, df)
+        answer_source = "Answer template" if explanation_md else "Answer Agent"
+        if explanation_md is None:
+            expl_agent = AnswerAgent(
+                api_key=openai_key,
+                model=model,
+                temperature=temperature,
+                client=openai_client,
+            )
+            # Stream into a placeholder so the answer appears as it is generated; it
+            # moves to the Answer tab once complete.
+            placeholder = st.empty()
+            chunks = []
+            for delta in expl_agent.stream(
+                st.session_state.get("question", ""), params, df
+            ):
+                chunks.append(delta)
+                placeholder.markdown("".join(chunks))
+            placeholder.empty()
+            explanation_md = "".join(chunks)
         t_answer_end = time.perf_counter()
         dt_answer_ms = int((t_answer_end - t_answer_start) * 1000)
         progress.progress(100)
         status_box.update(label="Step 3/3: Explanation generated", state="running")
         status_box.write(
-            f"**Step 3** · Answer Agent completed in **{dt_answer_ms} ms**."
+            f"**Step 3** · {answer_source} completed in **{dt_answer_ms} ms**."
         )
         total_ms = int((time.perf_counter() - t_overall) * 1000)
         status_box.update(
@@ -279,6 +365,8 @@ if submitted:
     st.session_state["last_params"] = params
     st.session_state["last_df"] = df
     st.session_state["last_latency_ms"] = dt_fetch_ms
+    st.session_state.pop("last_full_df", None)
+    st.session_state.pop("last_full_fp", None)
 
 # ---------- Results (if any) ----------
 if "last_params" in st.session_state and "last_df" in st.session_state:
@@ -316,16 +404,50 @@ if "last_params" in st.session_state and "last_df" in st.session_state:
             st.warning("No results were returned for these parameters.")
         else:
             st.markdown(
-                "These are the raw rows returned by USDA for the AI‑generated query parameters. Use the button below to download the full dataset as CSV."
+                "These are the raw rows returned by USDA for the AI‑generated query parameters. The preview shows the main columns; use the button below to download the full dataset (all columns) as CSV or Parquet."
             )
             cols_present = [c for c in PREFERRED if c in df.columns]
             others = [c for c in df.columns if c not in cols_present]
-            df_show = df[cols_present + others] if cols_present else df
-            st.dataframe(df_show.head(int(max_preview_rows)), width="stretch")
-            csv_bytes = df.to_csv(index=False).encode("utf-8")
-            st.download_button(
-                "Download full dataset (CSV)",
-                data=csv_bytes,
-                file_name="usda_quickstats_results.csv",
-                mime="text/csv",
-            )
+            # Slice first, then reorder, so only the previewed rows are copied.
+            df_show = df.head(int(max_preview_rows))
+            if cols_present:
+                df_show = df_show[cols_present + others]
+            st.dataframe(df_show, width="stretch")
+            if "last_full_df" not in st.session_state:
+                if st.button("Prepare full dataset for download"):
+                    # The raw response is on disk already, so this re-parses, not re-queries.
+                    full_df, full_meta = fetch_usda(
+                        usda_key, float(req_timeout), params
+                    )
+                    if full_meta.get("error"):
+                        st.error(
+                            f"Could not load the full dataset: {full_meta['error']}"
+                        )
+                    else:
+                        from src.usdai_agent.answer_agent import df_fingerprint
+
+                        # Fingerprint once per dataset; reruns reuse it as the cache key.
+                        st.session_state["last_full_df"] = full_df
+                        st.session_state["last_full_fp"] = (
+                            df_fingerprint(full_df) or f"unhashed-{time.time_ns()}"
+                        )
+                        st.rerun()
+            else:
+                encoded = encode_dataset(
+                    st.session_state["last_full_fp"], st.session_state["last_full_df"]
+                )
+                col_csv, col_parquet = st.columns(2)
+                with col_csv:
+                    st.download_button(
+                        "Download full dataset (CSV)",
+                        data=encoded["csv"],
+                        file_name="usda_quickstats_results.csv",
+                        mime="text/csv",
+                    )
+                with col_parquet:
+                    st.download_button(
+                        "Download full dataset (Parquet)",
+                        data=encoded["parquet"],
+                        file_name="usda_quickstats_results.parquet",
+                        mime="application/vnd.apache.parquet",
+                    )
@@ -0,0 +1,46 @@
+from __future__ import annotations
+import json
+import math
+from typing import Any, Union
+
+try:  # orjson is a declared dependency; the stdlib keeps this working without it
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+# orjson.JSONDecodeError subclasses this, so callers can catch one type either way.
+JSONDecodeError = json.JSONDecodeError
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    """Parse JSON from bytes or str."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj: Any) -> str:
+    """Serialize to a compact JSON str.
+
+    NaN and infinities become null; other values JSON can't represent are stringified.
+    """
+    if orjson is not None:
+        option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        return orjson.dumps(obj, default=str, option=option).decode("utf-8")
+    try:
+        return json.dumps(obj, default=str, separators=(",", ":"), allow_nan=False)
+    except ValueError:  # NaN/inf: emit null like orjson instead of invalid JSON
+        return json.dumps(
+            _finite(obj), default=str, separators=(",", ":"), allow_nan=False
+        )
+
+
+def _finite(obj: Any) -> Any:
+    """Copy of `obj` with non-finite floats replaced by None."""
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {k: _finite(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_finite(v) for v in obj]
+    return obj
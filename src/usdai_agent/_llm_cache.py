@@ -0,0 +1,68 @@
+from __future__ import annotations
+import hashlib
+import json
+import sqlite3
+import time
+from contextlib import closing
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+CACHE_DIR = Path.home() / ".cache" / "usdai"
+CACHE_PATH = CACHE_DIR / "llm_cache.sqlite3"
+# Entries older than this are ignored on read and pruned on write.
+CACHE_TTL = 7 * 24 * 3600
+
+
+def normalize_question(question: str) -> str:
+    """Lowercase and collapse whitespace so trivially different phrasings share a key."""
+    return " ".join(str(question).lower().split())
+
+
+def make_key(*parts: Any) -> str:
+    """Build a stable cache key from JSON-serializable parts."""
+    raw = json.dumps(parts, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def cached_prompt_tokens(resp: Any) -> Optional[int]:
+    """Prompt tokens served from OpenAI's prefix cache for a completion, if reported."""
+    details = getattr(getattr(resp, "usage", None), "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", None)
+    return int(cached) if cached is not None else None
+
+
+def _connect() -> sqlite3.Connection:
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(CACHE_PATH, timeout=5.0)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS llm_cache ("
+        "key TEXT PRIMARY KEY, value TEXT NOT NULL, ts REAL NOT NULL)"
+    )
+    return conn
+
+
+def get(key: str) -> Optional[Dict[str, Any]]:
+    """Return the cached dict for `key`, or None on miss, expiry, or an unusable cache."""
+    try:
+        with closing(_connect()) as conn:
+            row = conn.execute(
+                "SELECT value FROM llm_cache WHERE key = ? AND ts >= ?",
+                (key, time.time() - CACHE_TTL),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+    except Exception:
+        return None
+
+
+def put(key: str, value: Dict[str, Any]) -> None:
+    """Store `value` under `key`. Failures are swallowed — the cache is best effort."""
+    try:
+        now = time.time()
+        with closing(_connect()) as conn, conn:
+            conn.execute("DELETE FROM llm_cache WHERE ts < ?", (now - CACHE_TTL,))
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, ts) VALUES (?, ?, ?)",
+                (key, json.dumps(value, default=str), now),
+            )
+    except Exception:
+        pass
@@ -1,9 +1,29 @@
 from __future__ import annotations
+import hashlib
 import json
-from typing import Any, Dict
+import logging
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional
 
-import pandas as pd
-from openai import OpenAI
+from . import _json, _llm_cache
+
+# pandas, pyarrow and openai are imported on first use to keep app start-up fast.
+if TYPE_CHECKING:
+    import pandas as pd
+    from openai import OpenAI
+
+logger = logging.getLogger(__name__)
+
+# USDA values are strings like "1,234", "$5.20" or "(D)"; this matches the numeric ones
+# once thousands separators and currency signs are removed.
+_NUMBER_RE = r"^[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?$"
+
+# Kept static so the system message is a byte-identical prefix across requests (prompt
+# caching); everything request-specific goes in the user message.
+ANSWER_SYSTEM_PROMPT = (
+    "You are an agricultural data analyst. Given a user question, the USDA Quick Stats parameters "
+    "used, and a compact data excerpt+metrics, write a precise, concise answer in Markdown. "
+    "Use only the provided data—do not invent values. Prefer one short paragraph and up to 4 bullets."
+)
 
 
 class AnswerAgent:
@@ -12,6 +32,10 @@ class AnswerAgent:
     Usage:
         agent = AnswerAgent(api_key="...", model="gpt-4o-mini", temperature=0.2)
         md = agent.generate(question, params, df)
+        for piece in agent.stream(question, params, df):  # incremental
+            ...
+
+    Pass `client=` to reuse an existing OpenAI client instead of creating one.
     """
 
     def __init__(
@@ -20,45 +44,110 @@ class AnswerAgent:
         model: str = "gpt-4o-mini",
         temperature: float = 0.2,
         timeout: float = 60.0,
+        use_cache: bool = True,
+        client: Optional[OpenAI] = None,
+        max_tokens: int = 350,
     ):
         if not api_key:
             raise ValueError("OpenAI API key is required for AnswerAgent.")
-        if OpenAI is None:
-            raise RuntimeError(
-                "OpenAI SDK is not available. Install the 'openai' package."
-            )
-        self.client = OpenAI(api_key=api_key)
+        if client is None:
+            try:
+                from openai import OpenAI
+            except ImportError as e:
+                raise RuntimeError(
+                    "OpenAI SDK is not available. Install the 'openai' package."
+                ) from e
+            client = OpenAI(api_key=api_key)
+        # A shared client (e.g. one cached across Streamlit reruns) keeps its connections warm
+        self.client = client
         self.model = model
         self.temperature = float(temperature)
         self.timeout = float(timeout)
+        self.use_cache = bool(use_cache)
+        # The prompt asks for a paragraph and a few bullets; this caps runaway answers.
+        self.max_tokens = int(max_tokens)
 
     # ------------------------ public API ------------------------
     def generate(self, question: str, params: Dict[str, Any], df: pd.DataFrame) -> str:
-        brief = self._build_data_brief(df, params)
-        system_msg = (
-            "You are an agricultural data analyst. Given a user question, the USDA Quick Stats parameters "
-            "used, and a compact data excerpt+metrics, write a precise, concise answer in Markdown. "
-            "Use only the provided data—do not invent values. Prefer one short paragraph and up to 4 bullets."
+        return "".join(self.stream(question, params, df))
+
+    def stream(
+        self, question: str, params: Dict[str, Any], df: pd.DataFrame
+    ) -> Iterator[str]:
+        """Yield the Markdown answer in pieces as the model produces them.
+
+        A cached answer is yielded in one piece; errors are yielded as text for the UI.
+        Only answers the model finished (`finish_reason == "stop"`) are cached.
+        """
+        fingerprint = df_fingerprint(df)
+        use_cache = self.use_cache and fingerprint is not None
+        cache_key = _llm_cache.make_key(
+            "answer",
+            self.model,
+            self.temperature,
+            ANSWER_SYSTEM_PROMPT,
+            _llm_cache.normalize_question(question),
+            sorted(params.items()),
+            fingerprint,
         )
+        if use_cache:
+            cached = _llm_cache.get(cache_key)
+            if cached is not None and cached.get("markdown"):
+                yield cached["markdown"]
+                return
+        brief = self._build_data_brief(df, params)
         payload = {"question": question, "params": params, "data_brief": brief}
+        parts: List[str] = []
+        finish_reason: Optional[str] = None
         try:
-            resp = self.client.chat.completions.create(
+            chunks = self.client.chat.completions.create(
                 model=self.model,
                 temperature=self.temperature,
                 timeout=self.timeout,
+                max_completion_tokens=self.max_tokens,
+                stream=True,
+                stream_options={"include_usage": True},
                 messages=[
-                    {"role": "system", "content": system_msg},
-                    {"role": "user", "content": json.dumps(payload)},
+                    {"role": "system", "content": ANSWER_SYSTEM_PROMPT},
+                    {"role": "user", "content": _json.dumps(payload)},
                 ],
             )
-            return resp.choices[0].message.content or "(No content)"
+            for chunk in chunks:
+                if not chunk.choices:  # the final chunk carries only usage
+                    logger.info(
+                        "AnswerAgent prompt cache: %s cached prompt tokens",
+                        _llm_cache.cached_prompt_tokens(chunk),
+                    )
+                    continue
+                choice = chunk.choices[0]
+                finish_reason = choice.finish_reason or finish_reason
+                delta = choice.delta.content
+                if delta:
+                    parts.append(delta)
+                    yield delta
         except Exception as e:  # surface clean error text to the UI
-            return f"AI explanation error: {e}"
+            prefix = "\n\n" if parts else ""  # keep any partial answer readable
+            yield f"{prefix}AI explanation error: {e}"
+            return
+        if not parts:
+            yield "(No content)"
+        elif finish_reason == "length":
+            # Not cached: a cut-off answer would otherwise be replayed for good.
+            yield "\n\n_(Answer truncated at the length limit.)_"
+        elif use_cache and finish_reason == "stop":
+            _llm_cache.put(cache_key, {"markdown": "".join(parts)})
 
     # ------------------------ helpers ------------------------
     def _build_data_brief(
-        self, df: pd.DataFrame, params: Dict[str, Any], max_rows: int = 12
+        self,
+        df: pd.DataFrame,
+        params: Dict[str, Any],
+        max_rows: int = 12,
+        max_chars: int = 200,
     ) -> Dict[str, Any]:
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
         brief: Dict[str, Any] = {
             "rows": int(getattr(df, "shape", (0, 0))[0]),
             "cols": int(getattr(df, "shape", (0, 0))[1]),
@@ -67,33 +156,138 @@ class AnswerAgent:
             "sample": [],
             "metrics": {},
         }
-        # sample rows
+        # sample rows, built column-wise by Arrow; long strings are cut to cap prompt size
         try:
             head = df.head(max_rows)
-            brief["sample"] = head.to_dict(orient="records")
+            try:
+                records = pa.Table.from_pandas(head, preserve_index=False).to_pylist()
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                records = head.to_dict(orient="records")
+            brief["sample"] = [
+                {
+                    k: v[:max_chars] if isinstance(v, str) else v
+                    for k, v in record.items()
+                }
+                for record in records
+            ]
         except Exception:
             pass
-        # numeric metrics on 'value'
+        # numeric metrics on the value column, computed with Arrow kernels
         try:
-            if "value" in df.columns:
-                vals = df["value"].astype(str).str.replace(",", "").str.replace("$", "")
-                vals_num = pd.to_numeric(vals, errors="coerce")
-                if vals_num.notna().any():
-                    brief["metrics"]["value_min"] = float(vals_num.min())
-                    brief["metrics"]["value_max"] = float(vals_num.max())
-                    brief["metrics"]["value_mean"] = float(vals_num.mean())
+            value_col = _value_column(df)
+            if value_col is not None:
+                # astype first: Arrow rejects object columns mixing ints and strings
+                vals = pc.cast(
+                    pa.array(df[value_col].astype("string"), from_pandas=True),
+                    pa.string(),
+                )
+                vals = pc.replace_substring(vals, ",", "")
+                vals = pc.utf8_trim_whitespace(pc.replace_substring(vals, "$", ""))
+                # Suppressed cells like "(D)" or "(Z)" become nulls instead of failing the cast
+                vals_num = pc.cast(
+                    pc.if_else(pc.match_substring_regex(vals, _NUMBER_RE), vals, None),
+                    pa.float64(),
+                )
+                if vals_num.null_count < len(vals_num):
+                    min_max = pc.min_max(vals_num)
+                    brief["metrics"]["value_min"] = min_max["min"].as_py()
+                    brief["metrics"]["value_max"] = min_max["max"].as_py()
+                    brief["metrics"]["value_mean"] = pc.mean(vals_num).as_py()
         except Exception:
             pass
         # distinct years/states
         try:
-            if "year" in df.columns:
-                brief["metrics"]["years_present"] = sorted(
-                    list({str(y) for y in df["year"].dropna().astype(str)})
-                )
-            if "state_alpha" in df.columns:
-                brief["metrics"]["states_present"] = sorted(
-                    list({str(s) for s in df["state_alpha"].dropna().astype(str)})
-                )
+            for col, key in (
+                ("year", "years_present"),
+                ("state_alpha", "states_present"),
+            ):
+                if col in df.columns:
+                    arr = pa.array(df[col].astype("string"), from_pandas=True)
+                    brief["metrics"][key] = sorted(
+                        pc.unique(arr).drop_null().to_pylist()
+                    )
         except Exception:
             pass
         return brief
+
+
+def template_answer(
+    params: Dict[str, Any], df: pd.DataFrame, max_rows: int = 5
+) -> Optional[str]:
+    """Deterministic Markdown answer for simple lookups, or None when the LLM is needed.
+
+    "Simple" means one year, one state-level or national query and at most `max_rows`
+    rows — the single-figure questions that make up most traffic. County rows and rows
+    the template can't tell apart (e.g. SURVEY vs CENSUS) are left to the LLM.
+    """
+    year = params.get("year")
+    if isinstance(year, list):
+        year = year[0] if len(year) == 1 else None
+    state = params.get("state_alpha")
+    level = params.get("agg_level_desc")
+    national = level == "NATIONAL" and state is None
+    value_col = _value_column(df)
+    if (
+        not year
+        or not ((level == "STATE" and isinstance(state, str)) or national)
+        or value_col is None
+        or not 0 < len(df) <= max_rows
+    ):
+        return None
+    if "agg_level_desc" in df.columns and not (df["agg_level_desc"] == level).all():
+        return None
+
+    import pandas as pd
+
+    def cell(row: Dict[str, Any], col: str) -> str:
+        v = row.get(col)
+        return "" if v is None or pd.isna(v) else str(v).strip()
+
+    rows = df.head(max_rows).to_dict(orient="records")
+    place = (
+        "the United States"
+        if national
+        else (cell(rows[0], "state_name").title() or state)
+    )
+    n = len(rows)
+    lines = [
+        f"USDA Quick Stats returned {n} record{'s' if n != 1 else ''} for **{place}** in **{year}**:",
+        "",
+    ]
+    labels = set()
+    for row in rows:
+        desc = cell(row, "short_desc") or cell(row, "statisticcat_desc") or "Value"
+        period = cell(row, "reference_period_desc")
+        unit = cell(row, "unit_desc")
+        label = f"{desc} ({period})" if period else desc
+        if label in labels:  # rows differ in a column the template doesn't show
+            return None
+        labels.add(label)
+        unit_note = f" {unit}" if unit and unit not in desc else ""
+        lines.append(f"- {label}: **{cell(row, value_col)}**{unit_note}")
+    return "\n".join(lines)
+
+
+def _value_column(df: pd.DataFrame) -> Optional[str]:
+    """Name of the measurement column; Quick Stats returns it as "Value"."""
+    for col in ("Value", "value"):
+        if col in df.columns:
+            return col
+    return None
+
+
+def df_fingerprint(df: pd.DataFrame) -> Optional[str]:
+    """128-bit content hash of a DataFrame (columns + values, index ignored).
+
+    Returns None if the frame can't be hashed. Used as a cache key for LLM answers
+    and for encoded downloads.
+    """
+    import pandas as pd
+
+    try:
+        hashed = pd.util.hash_pandas_object(df, index=False).values.tobytes()
+    except Exception:
+        return None
+    h = hashlib.blake2b(hashed, digest_size=16)
+    h.update(json.dumps(list(map(str, df.columns))).encode("utf-8"))
+    return h.hexdigest()
@@ -1,9 +1,15 @@
 from __future__ import annotations
 import json
-import re
-from typing import Dict, Any, List, Optional
+import logging
+from typing import TYPE_CHECKING, Dict, Any, List, Optional
 
-from openai import OpenAI
+from . import _json, _llm_cache
+from ._states import to_alpha
+
+logger = logging.getLogger(__name__)
+
+if TYPE_CHECKING:
+    from openai import OpenAI
 
 ALLOWED_PARAMS: List[str] = [
     "commodity_desc",
@@ -28,58 +34,33 @@ ALLOWED_PARAMS: List[str] = [
     "short_desc",
 ]
 
-STATE_NAME_TO_ALPHA = {
-    "ALABAMA": "AL",
-    "ALASKA": "AK",
-    "ARIZONA": "AZ",
-    "ARKANSAS": "AR",
-    "CALIFORNIA": "CA",
-    "COLORADO": "CO",
-    "CONNECTICUT": "CT",
-    "DELAWARE": "DE",
-    "DISTRICT OF COLUMBIA": "DC",
-    "FLORIDA": "FL",
-    "GEORGIA": "GA",
-    "HAWAII": "HI",
-    "IDAHO": "ID",
-    "ILLINOIS": "IL",
-    "INDIANA": "IN",
-    "IOWA": "IA",
-    "KANSAS": "KS",
-    "KENTUCKY": "KY",
-    "LOUISIANA": "LA",
-    "MAINE": "ME",
-    "MARYLAND": "MD",
-    "MASSACHUSETTS": "MA",
-    "MICHIGAN": "MI",
-    "MINNESOTA": "MN",
-    "MISSISSIPPI": "MS",
-    "MISSOURI": "MO",
-    "MONTANA": "MT",
-    "NEBRASKA": "NE",
-    "NEVADA": "NV",
-    "NEW HAMPSHIRE": "NH",
-    "NEW JERSEY": "NJ",
-    "NEW MEXICO": "NM",
-    "NEW YORK": "NY",
-    "NORTH CAROLINA": "NC",
-    "NORTH DAKOTA": "ND",
-    "OHIO": "OH",
-    "OKLAHOMA": "OK",
-    "OREGON": "OR",
-    "PENNSYLVANIA": "PA",
-    "RHODE ISLAND": "RI",
-    "SOUTH CAROLINA": "SC",
-    "SOUTH DAKOTA": "SD",
-    "TENNESSEE": "TN",
-    "TEXAS": "TX",
-    "UTAH": "UT",
-    "VERMONT": "VT",
-    "VIRGINIA": "VA",
-    "WASHINGTON": "WA",
-    "WEST VIRGINIA": "WV",
-    "WISCONSIN": "WI",
-    "WYOMING": "WY",
+# Fields the model may return as arrays (state_name is folded into state_alpha)
+MULTI_VALUE_PARAMS: List[str] = [
+    "year",
+    "state_alpha",
+    "state_name",
+    "class_desc",
+    "freq_desc",
+    "county_ansi",
+    "county_name",
+    "short_desc",
+]
+
+# Structured Outputs schema: strict mode needs every key listed as required, so
+# fields that don't apply come back as null and are dropped by _sanitize_params.
+_STRING_OR_NULL = {"type": ["string", "null"]}
+USDA_PARAMS_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        k: (
+            {"anyOf": [{"type": "array", "items": {"type": "string"}}, _STRING_OR_NULL]}
+            if k in MULTI_VALUE_PARAMS
+            else _STRING_OR_NULL
+        )
+        for k in ALLOWED_PARAMS
+    },
+    "required": list(ALLOWED_PARAMS),
+    "additionalProperties": False,
 }
 
 # A few explicit few-shots keep the model grounded
@@ -129,8 +110,60 @@ FEW_SHOT_EXAMPLES = [
             "sector_desc": "CROPS",
         },
     },
+    {
+        "q": "Wheat production in the US for 2020",
+        "params": {
+            "commodity_desc": "WHEAT",
+            "statisticcat_desc": "PRODUCTION",
+            "unit_desc": "BU",
+            "agg_level_desc": "NATIONAL",
+            "year": "2020",
+            "sector_desc": "CROPS",
+        },
+    },
+    {
+        "q": "Soybean area planted in Illinois for 2021",
+        "params": {
+            "commodity_desc": "SOYBEANS",
+            "statisticcat_desc": "AREA PLANTED",
+            "unit_desc": "ACRES",
+            "agg_level_desc": "STATE",
+            "state_alpha": "IL",
+            "year": "2021",
+            "sector_desc": "CROPS",
+        },
+    },
+    {
+        "q": "Annual milk production in Wisconsin and Minnesota in 2022",
+        "params": {
+            "commodity_desc": "MILK",
+            "statisticcat_desc": "PRODUCTION",
+            "unit_desc": "LB",
+            "agg_level_desc": "STATE",
+            "state_alpha": ["MN", "WI"],
+            "year": "2022",
+            "freq_desc": "ANNUAL",
+            "sector_desc": "ANIMALS & PRODUCTS",
+        },
+    },
+    {
+        "q": "January 1 cattle inventory in Texas from 2018 to 2020",
+        "params": {
+            "commodity_desc": "CATTLE",
+            "class_desc": "INCL CALVES",
+            "statisticcat_desc": "INVENTORY",
+            "agg_level_desc": "STATE",
+            "state_alpha": "TX",
+            "year": ["2018", "2019", "2020"],
+            "reference_period_desc": "FIRST OF JAN",
+            "sector_desc": "ANIMALS & PRODUCTS",
+        },
+    },
 ]
 
+# SYSTEM_PROMPT is sent verbatim as the first message of every request. Keep it static
+# (nothing per-request interpolated) and above 1024 tokens so OpenAI's automatic prompt
+# caching can reuse it across calls; the few-shot list above is sized with that in mind.
 SYSTEM_PROMPT = f"""
 You convert a user's question into USDA Quick Stats API parameters.
 Return ONLY a single JSON object using keys from this list: {ALLOWED_PARAMS}.
@@ -146,7 +179,7 @@ Rules:
 - For prices, map to statisticcat_desc = PRICE RECEIVED when appropriate.
 - Do NOT guess counties.
 - Be conservative — fewer parameters are better than wrong parameters.
-Return JSON only. No prose. No code block fences.
+- Set every field that does not apply to null.
 
 Examples:
 {json.dumps(FEW_SHOT_EXAMPLES, indent=2)}
@@ -154,20 +187,18 @@ Examples:
 
 
 def _parse_json_object(txt: str) -> Dict[str, Any]:
-    txt = txt.strip()
-    # direct parse
+    # Structured Outputs guarantees a JSON object; anything else is a hard failure.
     try:
-        return json.loads(txt)
-    except Exception:
-        pass
-    # extract first {...}
-    m = re.search(r"\{[\s\S]*\}", txt)
-    if m:
-        try:
-            return json.loads(m.group(0))
-        except Exception:
-            return {}
-    return {}
+        obj = _json.loads(txt)
+    except ValueError:
+        return {}
+    return obj if isinstance(obj, dict) else {}
+
+
+def _normalize_year_list(items: List[str]) -> List[str]:
+    """Keep 4-digit years (as strings), de-duplicated and sorted ascending."""
+    # isascii() keeps this equivalent to [0-9]{4}; isdigit() alone accepts e.g. "²"
+    return sorted({x for x in items if len(x) == 4 and x.isascii() and x.isdigit()})
 
 
 def _sanitize_params(d: Dict[str, Any]) -> Dict[str, Any]:
@@ -193,14 +224,10 @@ def _sanitize_params(d: Dict[str, Any]) -> Dict[str, Any]:
         items = [x for x in items if x]
         # special handling
         if k == "state_name":
-            up = [x.upper() for x in items]
-            mapped = [STATE_NAME_TO_ALPHA[x] for x in up if x in STATE_NAME_TO_ALPHA]
+            mapped = [a for a in map(to_alpha, items) if a]
             return list(dict.fromkeys(mapped))  # de-dupe, preserve order
         if k == "year":
-            # keep as strings, ensure 4-digit
-            items = [x for x in items if re.fullmatch(r"\d{4}", x)]
-            # sort ascending, dedupe
-            return sorted(list(dict.fromkeys(items)))
+            return _normalize_year_list(items)
         # generic de-dupe
         return list(dict.fromkeys(items))
 
@@ -212,15 +239,7 @@ def _sanitize_params(d: Dict[str, Any]) -> Dict[str, Any]:
             if vals:
                 clean["state_alpha"] = vals if len(vals) > 1 else vals[0]
             continue
-        if k in (
-            "year",
-            "state_alpha",
-            "class_desc",
-            "freq_desc",
-            "county_ansi",
-            "county_name",
-            "short_desc",
-        ):
+        if k in MULTI_VALUE_PARAMS:
             vals = norm_list(k, v)
             if vals:
                 clean[k] = vals if len(vals) > 1 else vals[0]
@@ -238,6 +257,7 @@ class ParamAgent:
     Usage:
         agent = ParamAgent(api_key=OPENAI_API_KEY, model="gpt-4o-mini")
         params = agent.generate("Corn yield in Iowa for 2023")
+    Pass `client=` to reuse an existing OpenAI client instead of creating one.
     """
 
     def __init__(
@@ -246,13 +266,20 @@ class ParamAgent:
         model: str = "gpt-4o-mini",
         temperature: float = 0.1,
         timeout: float = 30.0,
+        use_cache: bool = True,
+        client: Optional[OpenAI] = None,
     ):
         if not api_key:
             raise ValueError("OpenAI API key is required for ParamAgent.")
-        self.client = OpenAI(api_key=api_key)
+        if client is None:
+            from openai import OpenAI  # deferred: the SDK is slow to import
+
+            client = OpenAI(api_key=api_key)
+        self.client = client
         self.model = model
         self.temperature = float(temperature)
         self.timeout = float(timeout)
+        self.use_cache = bool(use_cache)
 
     def generate(self, question: str) -> Dict[str, str]:
         """
@@ -260,7 +287,20 @@ class ParamAgent:
         """
         if not question or not question.strip():
             return {}
-        user_prompt = f"User question: {question}\nReturn JSON only."
+        # The prompt is part of the key so editing it invalidates stale entries.
+        cache_key = _llm_cache.make_key(
+            "params",
+            self.model,
+            self.temperature,
+            SYSTEM_PROMPT,
+            USDA_PARAMS_SCHEMA,
+            _llm_cache.normalize_question(question),
+        )
+        if self.use_cache:
+            cached = _llm_cache.get(cache_key)
+            if cached is not None:
+                return cached
+        user_prompt = f"User question: {question}"
         try:
             resp = self.client.chat.completions.create(
                 model=self.model,
@@ -269,10 +309,25 @@ class ParamAgent:
                     {"role": "system", "content": SYSTEM_PROMPT},
                     {"role": "user", "content": user_prompt},
                 ],
+                response_format={
+                    "type": "json_schema",
+                    "json_schema": {
+                        "name": "usda_params",
+                        "schema": USDA_PARAMS_SCHEMA,
+                        "strict": True,
+                    },
+                },
                 timeout=self.timeout,
             )
+            logger.info(
+                "ParamAgent prompt cache: %s cached prompt tokens",
+                _llm_cache.cached_prompt_tokens(resp),
+            )
             content = resp.choices[0].message.content or ""
             raw = _parse_json_object(content)
-            return _sanitize_params(raw)
+            params = _sanitize_params(raw)
+            if params and self.use_cache:
+                _llm_cache.put(cache_key, params)
+            return params
         except Exception:
             return {}
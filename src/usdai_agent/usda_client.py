@@ -1,8 +1,20 @@
+import hashlib
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+from urllib.parse import urlencode
+
 import httpx
-from typing import Any, Dict, Tuple
 import pandas as pd
 
+from . import _json
+
 USDA_BASE_URL = "https://quickstats.nass.usda.gov/api/api_GET/"
+# Quick Stats series update at most daily, so cached responses stay valid for a day.
+DEFAULT_CACHE_DIR = Path(".cache") / "usda"
+DEFAULT_CACHE_TTL = 24 * 3600.0
 DEFAULT_EXAMPLE_PARAMS = {
     "commodity_desc": "CORN",
     "statisticcat_desc": "YIELD",
@@ -19,48 +31,174 @@ class USDAClient:
     Usage:
         client = USDAClient(api_key="...")
         df, meta = client.fetch(params={"commodity_desc": "CORN", ...})
+
+    Successful responses are cached on disk under `cache_dir` for `cache_ttl` seconds,
+    keyed by the canonicalized query. Pass `cache_dir=None` to disable.
     """
 
-    def __init__(self, api_key: str, timeout: float = 60.0) -> None:
+    def __init__(
+        self,
+        api_key: str,
+        timeout: float = 60.0,
+        cache_dir: Optional[Union[str, Path]] = DEFAULT_CACHE_DIR,
+        cache_ttl: float = DEFAULT_CACHE_TTL,
+    ) -> None:
         if not api_key:
             raise ValueError("USDA API key is required")
         self.api_key = api_key
         self.timeout = timeout
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else None
+        self.cache_ttl = float(cache_ttl)
+        # One pooled client per instance so repeat queries reuse the TCP+TLS connection.
+        self._client = httpx.Client(
+            base_url=USDA_BASE_URL,
+            timeout=timeout,
+            limits=httpx.Limits(max_keepalive_connections=4, keepalive_expiry=300.0),
+        )
+
+    def close(self) -> None:
+        """Close the underlying connection pool."""
+        self._client.close()
+
+    def __enter__(self) -> "USDAClient":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
 
     def check_connection(self) -> bool:
         """Check the connection to the USDA API."""
         try:
-            with httpx.Client(timeout=self.timeout) as client:
-                resp = client.get(
-                    USDA_BASE_URL,
-                    params={
-                        "key": self.api_key,
-                        **DEFAULT_EXAMPLE_PARAMS,
-                    },  # Small query to check connection
-                )
-                resp.raise_for_status()
-                return True
+            resp = self._client.get(
+                "",
+                params={
+                    "key": self.api_key,
+                    **DEFAULT_EXAMPLE_PARAMS,
+                },  # Small query to check connection
+            )
+            resp.raise_for_status()
+            return True
         except Exception as e:
-            print(f"Error connecting to USDA API: {e}")
+            print(f"Error connecting to USDA API: {self._describe_error(e)}")
             return False
 
-    def fetch(self, params: Dict[str, Any]) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    def fetch(
+        self, params: Dict[str, Any], *, columns: Optional[List[str]] = None
+    ) -> Tuple[pd.DataFrame, Dict[str, Any]]:
         """Fetch data from the USDA Quick Stats API.
 
         Args:
             params: Query parameters for the API request.
+            columns: If given, only these columns (those present in the response) are
+                kept. USDA returns ~40 columns per row; projecting before the DataFrame
+                is built skips the allocation for the rest.
 
         Returns:
-            A tuple containing a Polars DataFrame with the results and metadata.
+            A tuple containing a pandas DataFrame with the results and metadata
+            (`rows`, `from_cache`, and `error` when the request failed).
         """
         try:
-            with httpx.Client(timeout=self.timeout) as client:
-                resp = client.get(USDA_BASE_URL, params={"key": self.api_key, **params})
+            cache_path = self._cache_path(params)
+            raw = self._read_cache(cache_path)
+            from_cache = raw is not None
+            if raw is None:
+                resp = self._client.get("", params={"key": self.api_key, **params})
                 resp.raise_for_status()
-                data = resp.json()
-                results = data.get("data")
-                df = pd.DataFrame(results)
-                return df
+                raw = resp.content
+            payload = _json.loads(raw)
+            if not isinstance(payload, dict) or not isinstance(
+                payload.get("data"), list
+            ):
+                raise ValueError("Unexpected USDA API response format")
+            if not from_cache:
+                # Only parsed responses are cached, so an HTML error page served with
+                # a 200 isn't replayed for the whole TTL.
+                self._write_cache(cache_path, raw)
+            results = payload["data"]
+            if columns is not None and results:
+                columns = [c for c in columns if c in results[0]]
+            df = pd.DataFrame(results, columns=columns)
+            return df, {"rows": int(df.shape[0]), "from_cache": from_cache}
         except Exception as e:
-            print(f"Error fetching USDA data: {e}")
-            return pd.DataFrame(), {}
+            error = self._describe_error(e)
+            print(f"Error fetching USDA data: {error}")
+            return pd.DataFrame(), {"rows": 0, "from_cache": False, "error": error}
+
+    def _describe_error(self, e: Exception) -> str:
+        """Error text that is safe to show: httpx messages embed the URL, key included."""
+        if isinstance(e, httpx.HTTPStatusError):
+            message = f"USDA API returned HTTP {e.response.status_code}"
+            try:
+                detail = _json.loads(e.response.content).get("error")
+            except Exception:
+                detail = None
+            if isinstance(detail, list):
+                detail = "; ".join(map(str, detail))
+            if detail:
+                message = f"{message}: {detail}"
+        elif isinstance(e, _json.JSONDecodeError):
+            message = "USDA API returned a response that is not JSON"
+        elif isinstance(e, httpx.RequestError):
+            message = f"USDA API request failed ({type(e).__name__})"
+        else:
+            message = str(e)
+        return message.replace(self.api_key, "***") if self.api_key else message
+
+    # ------------------------ disk cache ------------------------
+    def _cache_path(self, params: Dict[str, Any]) -> Optional[Path]:
+        if self.cache_dir is None:
+            return None
+        # Canonical query: sorted keys, sorted multi-values. The API key is left out
+        # on purpose — it doesn't change the data and shouldn't end up on disk.
+        canonical = sorted(
+            (k, sorted(map(str, v)) if isinstance(v, (list, tuple)) else str(v))
+            for k, v in params.items()
+        )
+        query = urlencode(canonical, doseq=True)
+        key = hashlib.sha1(query.encode("utf-8")).hexdigest()
+        return self.cache_dir / f"{key}.json"
+
+    def _read_cache(self, path: Optional[Path]) -> Optional[bytes]:
+        if path is None:
+            return None
+        try:
+            if time.time() - path.stat().st_mtime > self.cache_ttl:
+                path.unlink(missing_ok=True)
+                return None
+            return path.read_bytes()
+        except OSError:
+            return None
+
+    def _write_cache(self, path: Optional[Path], raw: bytes) -> None:
+        if path is None:
+            return
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # A unique temp file per write: Streamlit sessions are threads of one
+            # process, so a pid-based name would be shared between them.
+            fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(raw)
+                os.replace(tmp, path)  # atomic, so readers never see a partial file
+            except BaseException:
+                os.unlink(tmp)
+                raise
+        except OSError as e:
+            print(f"Could not write USDA cache file {path}: {e}")
+        self._prune_cache()
+
+    def _prune_cache(self) -> None:
+        """Delete expired entries, including ones for queries that are never repeated."""
+        if self.cache_dir is None:
+            return
+        cutoff = time.time() - self.cache_ttl
+        try:
+            for entry in self.cache_dir.glob("*.json"):
+                try:
+                    if entry.stat().st_mtime < cutoff:
+                        entry.unlink(missing_ok=True)
+                except OSError:
+                    pass
+        except OSError:
+            pass
@@ -0,0 +1,151 @@
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+from usdai_agent import answer_agent
+from usdai_agent.answer_agent import AnswerAgent, template_answer
+
+STATE_PARAMS = {"agg_level_desc": "STATE", "state_alpha": "IA", "year": "2023"}
+
+
+def _rows(*rows):
+    base = {
+        "agg_level_desc": "STATE",
+        "state_name": "IOWA",
+        "short_desc": "CORN, GRAIN - YIELD, MEASURED IN BU / ACRE",
+        "reference_period_desc": "YEAR",
+        "unit_desc": "BU / ACRE",
+    }
+    return pd.DataFrame([{**base, **row} for row in rows])
+
+
+def test_single_state_figure():
+    md = template_answer(STATE_PARAMS, _rows({"Value": "201"}))
+    assert md is not None
+    assert "**Iowa**" in md and "**2023**" in md
+    assert "CORN, GRAIN - YIELD, MEASURED IN BU / ACRE (YEAR): **201**" in md
+
+
+def test_distinct_periods_are_listed():
+    df = _rows(
+        {"Value": "201", "reference_period_desc": "YEAR"},
+        {"Value": "198", "reference_period_desc": "YEAR - AUG FORECAST"},
+    )
+    md = template_answer(STATE_PARAMS, df)
+    assert md is not None
+    assert md.count("\n- ") == 2
+
+
+def test_national_query():
+    params = {"agg_level_desc": "NATIONAL", "year": ["2023"]}
+    df = _rows({"Value": "177.3", "agg_level_desc": "NATIONAL"})
+    md = template_answer(params, df)
+    assert md is not None and "the United States" in md
+
+
+def test_county_query_goes_to_llm():
+    params = {**STATE_PARAMS, "agg_level_desc": "COUNTY", "state_alpha": "DE"}
+    df = _rows(
+        {"Value": "180", "agg_level_desc": "COUNTY", "county_name": "KENT"},
+        {"Value": "175", "agg_level_desc": "COUNTY", "county_name": "NEW CASTLE"},
+        {"Value": "190", "agg_level_desc": "COUNTY", "county_name": "SUSSEX"},
+    )
+    assert template_answer(params, df) is None
+
+
+def test_county_rows_without_level_param_go_to_llm():
+    params = {"state_alpha": "DE", "year": "2023"}
+    assert template_answer(params, _rows({"Value": "180"})) is None
+    df = _rows({"Value": "180", "agg_level_desc": "COUNTY"})
+    assert template_answer(STATE_PARAMS, df) is None
+
+
+def test_indistinguishable_rows_go_to_llm():
+    df = _rows(
+        {"Value": "12,400,000", "source_desc": "SURVEY"},
+        {"Value": "12,371,000", "source_desc": "CENSUS"},
+    )
+    assert template_answer(STATE_PARAMS, df) is None
+
+
+def test_not_simple():
+    df = _rows({"Value": "201"})
+    assert template_answer({**STATE_PARAMS, "year": ["2022", "2023"]}, df) is None
+    assert template_answer({**STATE_PARAMS, "state_alpha": ["IA", "IL"]}, df) is None
+    assert template_answer(STATE_PARAMS, _rows(*[{"Value": "1"}] * 6)) is None
+    assert template_answer(STATE_PARAMS, df.drop(columns="Value")) is None
+    assert template_answer(STATE_PARAMS, df.iloc[0:0]) is None
+
+
+def _chunk(content, finish_reason=None):
+    delta = SimpleNamespace(content=content)
+    choice = SimpleNamespace(delta=delta, finish_reason=finish_reason)
+    return SimpleNamespace(choices=[choice], usage=None)
+
+
+class _FakeCompletions:
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.calls = 0
+
+    def create(self, **kwargs):
+        self.calls += 1
+        return iter(self.chunks + [SimpleNamespace(choices=[], usage=None)])
+
+
+@pytest.fixture
+def llm_cache(monkeypatch):
+    store = {}
+    monkeypatch.setattr(answer_agent._llm_cache, "get", store.get)
+    monkeypatch.setattr(answer_agent._llm_cache, "put", store.__setitem__)
+    return store
+
+
+def _agent(chunks):
+    completions = _FakeCompletions(chunks)
+    client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    return AnswerAgent(api_key="k", client=client), completions
+
+
+def test_stream_caches_finished_answer(llm_cache):
+    agent, completions = _agent([_chunk("Yield was "), _chunk("201.", "stop")])
+    df = _rows({"Value": "201"})
+    assert list(agent.stream("q", STATE_PARAMS, df)) == ["Yield was ", "201."]
+    assert agent.generate("Q ", STATE_PARAMS, df) == "Yield was 201."
+    assert completions.calls == 1
+
+
+def test_stream_does_not_cache_truncated_answer(llm_cache):
+    agent, completions = _agent([_chunk("Yield was", "length")])
+    df = _rows({"Value": "201"})
+    md = agent.generate("q", STATE_PARAMS, df)
+    assert md.startswith("Yield was") and "truncated" in md
+    assert not llm_cache
+    agent.generate("q", STATE_PARAMS, df)
+    assert completions.calls == 2
+
+
+def test_data_brief_value_metrics():
+    agent, _ = _agent([])
+    df = pd.DataFrame(
+        {
+            "Value": ["1,234", "$5.20", "(D)", "", None, 10, " 12 "],
+            "year": [2023, 2023, 2022, 2022, 2022, 2022, 2022],
+            "state_alpha": ["IA", "IA", "IL", None, "IL", "IL", "IL"],
+        }
+    )
+    metrics = agent._build_data_brief(df, STATE_PARAMS)["metrics"]
+    assert metrics["value_min"] == 5.2
+    assert metrics["value_max"] == 1234.0
+    assert metrics["value_mean"] == pytest.approx((1234 + 5.2 + 10 + 12) / 4)
+    assert metrics["years_present"] == ["2022", "2023"]
+    assert metrics["states_present"] == ["IA", "IL"]
+
+
+def test_data_brief_without_numeric_values():
+    agent, _ = _agent([])
+    df = pd.DataFrame({"Value": ["(D)", "(Z)", None]})
+    brief = agent._build_data_brief(df, STATE_PARAMS)
+    assert "value_min" not in brief["metrics"]
+    assert brief["rows"] == 3 and len(brief["sample"]) == 3
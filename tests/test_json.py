@@ -0,0 +1,26 @@
+import json
+import math
+
+import pytest
+
+from usdai_agent import _json
+
+
+@pytest.fixture(params=["orjson", "stdlib"])
+def backend(request, monkeypatch):
+    if request.param == "orjson":
+        pytest.importorskip("orjson")
+    else:
+        monkeypatch.setattr(_json, "orjson", None)
+    return request.param
+
+
+def test_non_finite_floats_become_null(backend):
+    out = _json.dumps({"a": math.nan, "b": [1.5, math.inf, (2, -math.inf)]})
+    assert json.loads(out) == {"a": None, "b": [1.5, None, [2, None]]}
+
+
+def test_round_trip(backend):
+    obj = {"year": 2023, "state": "IA", "values": ["1,234", None]}
+    assert _json.loads(_json.dumps(obj)) == obj
+    assert _json.loads(_json.dumps(obj).encode("utf-8")) == obj
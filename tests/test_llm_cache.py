@@ -0,0 +1,65 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from usdai_agent import _llm_cache, param_agent
+from usdai_agent.param_agent import ParamAgent
+
+
+@pytest.fixture(autouse=True)
+def cache_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(_llm_cache, "CACHE_DIR", tmp_path)
+    monkeypatch.setattr(_llm_cache, "CACHE_PATH", tmp_path / "llm_cache.sqlite3")
+    return tmp_path / "llm_cache.sqlite3"
+
+
+def test_hit_and_miss():
+    key = _llm_cache.make_key("params", "gpt-4o-mini", 0.1, "corn yield iowa 2023")
+    assert _llm_cache.get(key) is None
+    _llm_cache.put(key, {"commodity_desc": "CORN"})
+    assert _llm_cache.get(key) == {"commodity_desc": "CORN"}
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    _llm_cache.put("key", {"a": 1})
+    now = time.time()
+    monkeypatch.setattr(_llm_cache.time, "time", lambda: now + _llm_cache.CACHE_TTL + 1)
+    assert _llm_cache.get("key") is None
+    _llm_cache.put("other", {"b": 2})  # prunes the expired row
+    monkeypatch.setattr(_llm_cache.time, "time", lambda: now)
+    assert _llm_cache.get("key") is None
+
+
+def test_normalized_questions_share_a_key():
+    assert _llm_cache.normalize_question("  Corn   Yield\nIOWA ") == "corn yield iowa"
+    assert _llm_cache.make_key("a", [1, 2]) == _llm_cache.make_key("a", [1, 2])
+    assert _llm_cache.make_key("a", [1, 2]) != _llm_cache.make_key("a", [2, 1])
+
+
+def _param_agent(temperature, calls):
+    def create(**kwargs):
+        calls.append(kwargs)
+        message = SimpleNamespace(content='{"commodity_desc": "CORN", "year": "2023"}')
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+    completions = SimpleNamespace(create=create)
+    client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    return ParamAgent(api_key="k", temperature=temperature, client=client)
+
+
+def test_param_agent_key_includes_temperature():
+    calls = []
+    first = _param_agent(0.1, calls).generate("Corn yield in 2023")
+    assert _param_agent(0.1, calls).generate("corn  yield in 2023") == first
+    assert len(calls) == 1
+    _param_agent(0.7, calls).generate("Corn yield in 2023")
+    assert len(calls) == 2
+
+
+def test_param_agent_key_includes_prompt(monkeypatch):
+    calls = []
+    _param_agent(0.1, calls).generate("Corn yield in 2023")
+    monkeypatch.setattr(param_agent, "SYSTEM_PROMPT", param_agent.SYSTEM_PROMPT + " ")
+    _param_agent(0.1, calls).generate("Corn yield in 2023")
+    assert len(calls) == 2
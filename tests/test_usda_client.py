@@ -0,0 +1,103 @@
+import os
+import time
+
+import httpx
+
+from usdai_agent.usda_client import USDA_BASE_URL, USDAClient
+
+
+def _client(handler, cache_dir=None):
+    client = USDAClient(api_key="SECRET", cache_dir=cache_dir)
+    client._client = httpx.Client(
+        base_url=USDA_BASE_URL, transport=httpx.MockTransport(handler)
+    )
+    return client
+
+
+def test_http_error_is_scrubbed():
+    client = _client(lambda req: httpx.Response(400, json={"error": ["bad request"]}))
+    df, meta = client.fetch({"commodity_desc": "BAD"})
+    assert df.empty
+    assert meta["error"] == "USDA API returned HTTP 400: bad request"
+
+
+def test_request_error_is_scrubbed():
+    def handler(req):
+        raise httpx.ConnectError(f"cannot reach {req.url}", request=req)
+
+    _, meta = _client(handler).fetch({"commodity_desc": "CORN"})
+    assert "SECRET" not in meta["error"]
+    assert "ConnectError" in meta["error"]
+
+
+def test_non_json_response_is_not_cached(tmp_path):
+    responses = [
+        httpx.Response(200, text="<html>Down for maintenance</html>"),
+        httpx.Response(200, json={"data": [{"year": 2023, "Value": "201"}]}),
+    ]
+    client = _client(lambda req: responses.pop(0), cache_dir=tmp_path)
+    df, meta = client.fetch({"commodity_desc": "CORN"})
+    assert df.empty and "not JSON" in meta["error"]
+    assert not list(tmp_path.iterdir())
+    df, meta = client.fetch({"commodity_desc": "CORN"})
+    assert "error" not in meta and df["Value"].tolist() == ["201"]
+    _, meta = client.fetch({"commodity_desc": "CORN"})
+    assert meta["from_cache"]
+
+
+def test_cache_path_is_canonical(tmp_path):
+    client = USDAClient(api_key="SECRET", cache_dir=tmp_path)
+    a = client._cache_path({"year": ["2023", "2022"], "state_alpha": "IA"})
+    b = client._cache_path({"state_alpha": "IA", "year": ["2022", "2023"]})
+    assert a == b and a.parent == tmp_path
+    assert a != client._cache_path({"state_alpha": "IL", "year": ["2022", "2023"]})
+    other_key = USDAClient(api_key="OTHER", cache_dir=tmp_path)
+    assert other_key._cache_path({"state_alpha": "IA", "year": ["2022", "2023"]}) == a
+    assert "SECRET" not in a.name
+    assert USDAClient(api_key="SECRET", cache_dir=None)._cache_path({}) is None
+
+
+def test_read_cache_unlinks_expired_entry(tmp_path):
+    client = USDAClient(api_key="SECRET", cache_dir=tmp_path, cache_ttl=60)
+    path = client._cache_path({"commodity_desc": "CORN"})
+    client._write_cache(path, b'{"data": []}')
+    assert client._read_cache(path) == b'{"data": []}'
+    os.utime(path, (time.time() - 120, time.time() - 120))
+    assert client._read_cache(path) is None
+    assert not path.exists()
+
+
+def test_prune_cache_removes_only_expired_entries(tmp_path):
+    client = USDAClient(api_key="SECRET", cache_dir=tmp_path, cache_ttl=60)
+    stale = client._cache_path({"commodity_desc": "OATS"})
+    fresh = client._cache_path({"commodity_desc": "CORN"})
+    stale.write_bytes(b"{}")
+    fresh.write_bytes(b"{}")
+    os.utime(stale, (time.time() - 120, time.time() - 120))
+    client._prune_cache()
+    assert not stale.exists() and fresh.exists()
+
+
+def test_fetch_projects_columns():
+    rows = [{"year": 2023, "state_alpha": "IA", "Value": "201", "CV (%)": "1.2"}]
+    client = _client(lambda req: httpx.Response(200, json={"data": rows}))
+    df, meta = client.fetch({}, columns=["Value", "county_name", "year"])
+    assert list(df.columns) == ["Value", "year"]
+    assert meta == {"rows": 1, "from_cache": False}
+    df, _ = client.fetch({})
+    assert list(df.columns) == ["year", "state_alpha", "Value", "CV (%)"]
+
+
+def test_fetch_projection_of_empty_result():
+    client = _client(lambda req: httpx.Response(200, json={"data": []}))
+    df, meta = client.fetch({}, columns=["Value", "year"])
+    assert df.empty and meta["rows"] == 0 and "error" not in meta
+
+
+def test_check_connection_log_is_scrubbed(capsys):
+    def handler(req):
+        raise httpx.ConnectError(f"cannot reach {req.url}", request=req)
+
+    assert _client(handler).check_connection() is False
+    out = capsys.readouterr().out
+    assert "ConnectError" in out and "SECRET" not in out